@@ -643,17 +643,16 @@ class DownloadTask(object):
         self._last_progress_updated = 0.
 
         # If the tempname already exists, set progress accordingly
-        if os.path.exists(self.tempname):
-            try:
-                already_downloaded = os.path.getsize(self.tempname)
-                if self.total_size > 0:
-                    self.progress = max(0.0, min(1.0, already_downloaded / self.total_size))
-            except OSError as os_error:
-                logger.error('Cannot get size for %s', os_error)
-        else:
+        try:
+            already_downloaded = os.path.getsize(self.tempname)
+            if self.total_size > 0:
+                self.progress = max(0.0, min(1.0, already_downloaded / self.total_size))
+        except FileNotFoundError:
             # "touch self.tempname", so we also get partial
             # files for resuming when the file is queued
             open(self.tempname, 'w').close()
+        except OSError as os_error:
+            logger.error('Cannot get size for %s', os_error)
 
         # Store a reference to this task in the episode
         episode.download_task = self
@@ -584,9 +584,14 @@ class PodcastListModel(Gtk.ListStore):
         self._filter.set_visible_func(self._filter_visible_func)
 
         self._cover_cache = {}
+        self._emblem_cache = {}
         self._max_image_side = 40
         self._cover_downloader = cover_downloader
 
+        # Emblems are loaded from the icon theme, so drop them on theme changes
+        Gtk.IconTheme.get_default().connect('changed',
+                lambda icon_theme: self._emblem_cache.clear())
+
         self.ICON_DISABLED = 'media-playback-pause'
         self.ICON_ERROR = 'dialog-warning'
 
@@ -695,16 +700,27 @@ class PodcastListModel(Gtk.ListStore):
 
         return self._resize_pixbuf_keep_ratio(url, pixbuf) or pixbuf
 
+    def _load_emblem(self, icon, size):
+        """
+        Returns the emblem pixbuf for the given icon name and size,
+        loading it from the icon theme only on the first request.
+        """
+        key = (icon, size)
+        if key not in self._emblem_cache:
+            icon_theme = Gtk.IconTheme.get_default()
+            self._emblem_cache[key] = icon_theme.load_icon(icon, size, 0)
+
+        return self._emblem_cache[key]
+
     def _overlay_pixbuf(self, pixbuf, icon):
         try:
-            icon_theme = Gtk.IconTheme.get_default()
-            emblem = icon_theme.load_icon(icon, self._max_image_side / 2, 0)
+            emblem = self._load_emblem(icon, self._max_image_side / 2)
             (width, height) = (emblem.get_width(), emblem.get_height())
             xpos = pixbuf.get_width() - width
             ypos = pixbuf.get_height() - height
             if ypos < 0:
                 # need to resize overlay for none standard icon size
-                emblem = icon_theme.load_icon(icon, pixbuf.get_height() - 1, 0)
+                emblem = self._load_emblem(icon, pixbuf.get_height() - 1)
                 (width, height) = (emblem.get_width(), emblem.get_height())
                 xpos = pixbuf.get_width() - width
                 ypos = pixbuf.get_height() - height
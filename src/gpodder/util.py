@@ -32,6 +32,7 @@ are not tied to any specific part of gPodder.
 import collections
 import datetime
 import email
+import functools
 import glob
 import gzip
 import http.client
@@ -58,7 +59,7 @@ import urllib.error
 import urllib.parse
 import webbrowser
 import xml.dom.minidom
-from html.entities import entitydefs, name2codepoint
+from html.entities import html5, name2codepoint
 from html.parser import HTMLParser
 
 import gi
@@ -156,6 +157,7 @@ _MIME_TYPE_LIST = [
 
 _MIME_TYPES = dict((k, v) for v, k in _MIME_TYPE_LIST)
 _MIME_TYPES_EXT = dict(_MIME_TYPE_LIST)
+_FILE_TYPES_EXT = dict((k, v.split('/', 1)[0]) for k, v in _MIME_TYPE_LIST)
 
 
 def is_absolute_url(url):
@@ -202,6 +204,19 @@ def make_directory(path):
     return True
 
 
+# This is a list of prefixes that you can use to minimize the amount of
+# keystrokes that you have to use.
+# Feel free to suggest other useful prefixes, and I'll add them here.
+_FEED_URL_SHORTCUTS = {
+        'fb:': 'http://feeds.feedburner.com/%s',
+        'yt:': 'http://www.youtube.com/rss/user/%s/videos.rss',
+        'sc:': 'https://soundcloud.com/%s',
+        # YouTube playlists. To get a list of playlists per-user, use:
+        # https://gdata.youtube.com/feeds/api/users/<username>/playlists
+        'ytpl:': 'http://gdata.youtube.com/feeds/api/playlists/%s',
+}
+
+
 def normalize_feed_url(url):
     """
     Converts any URL to http:// or ftp:// so that it can be
@@ -225,6 +240,13 @@ def normalize_feed_url(url):
     >>> normalize_feed_url('fb:43FPodcast')
     'http://feeds.feedburner.com/43FPodcast'
 
+    Schemes and shortcuts are not case sensitive either:
+
+    >>> normalize_feed_url('FB:43FPodcast')
+    'http://feeds.feedburner.com/43FPodcast'
+    >>> normalize_feed_url('HTTP://example.org/feed.rss')
+    'http://example.org/feed.rss'
+
     It will also take care of converting the domain name to
     all-lowercase (because domains are not case sensitive):
 
@@ -246,22 +268,11 @@ def normalize_feed_url(url):
     if not url or len(url) < 8:
         return None
 
-    # This is a list of prefixes that you can use to minimize the amount of
-    # keystrokes that you have to use.
-    # Feel free to suggest other useful prefixes, and I'll add them here.
-    PREFIXES = {
-            'fb:': 'http://feeds.feedburner.com/%s',
-            'yt:': 'http://www.youtube.com/rss/user/%s/videos.rss',
-            'sc:': 'https://soundcloud.com/%s',
-            # YouTube playlists. To get a list of playlists per-user, use:
-            # https://gdata.youtube.com/feeds/api/users/<username>/playlists
-            'ytpl:': 'http://gdata.youtube.com/feeds/api/playlists/%s',
-    }
-
-    for prefix, expansion in PREFIXES.items():
-        if url.startswith(prefix):
-            url = expansion % (url[len(prefix):],)
-            break
+    # All shortcuts end with the first colon, so a single lookup is enough
+    prefix, colon, rest = url.partition(':')
+    expansion = _FEED_URL_SHORTCUTS.get(prefix.lower() + colon)
+    if expansion is not None:
+        url = expansion % (rest,)
 
     # Assume HTTP for URLs without scheme
     if '://' not in url:
@@ -369,7 +380,40 @@ def directory_is_writable(path):
     Returns True if the specified directory exists and is writable
     by the current user.
     """
-    return os.path.isdir(path) and os.access(path, os.W_OK)
+    try:
+        st = os.stat(path)
+    except (OSError, ValueError):
+        return False
+
+    # os.access() is still needed to honor ACLs and read-only mounts
+    return stat.S_ISDIR(st.st_mode) and os.access(path, os.W_OK)
+
+
+def _sum_tree(path):
+    """
+    Returns the size of the directory at path and of all entries
+    below it, without following symbolic links.
+    """
+    sum = os.path.getsize(path)
+
+    # Iterative traversal; scandir() entries cache their lstat()
+    # result, so every entry costs at most one syscall
+    stack = [path]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        sum += entry.stat(follow_symlinks=False).st_size
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                    except OSError:
+                        logger.warn('Cannot get size for %s', entry.path, exc_info=True)
+        except OSError:
+            logger.warn('Cannot access %s', directory, exc_info=True)
+
+    return sum
 
 
 def calculate_size(path):
@@ -389,18 +433,7 @@ def calculate_size(path):
         return os.path.getsize(path)
 
     if os.path.isdir(path) and not os.path.islink(path):
-        sum = os.path.getsize(path)
-
-        try:
-            for item in os.listdir(path):
-                try:
-                    sum += calculate_size(os.path.join(path, item))
-                except:
-                    logger.warn('Cannot get size for %s', path, exc_info=True)
-        except:
-            logger.warn('Cannot access %s', path, exc_info=True)
-
-        return sum
+        return _sum_tree(path)
 
     return 0
 
@@ -570,25 +603,35 @@ def format_date(timestamp):
         return timestamp.strftime('%x')
 
 
+_SI_UNITS = (
+        ('kB', 10**3),
+        ('MB', 10**6),
+        ('GB', 10**9),
+)
+
+_BINARY_UNITS = (
+        ('KiB', 2**10),
+        ('MiB', 2**20),
+        ('GiB', 2**30),
+)
+
+
 def format_filesize(bytesize, use_si_units=False, digits=2):
     """
     Formats the given size in bytes to be human-readable,
 
     Returns a localized "(unknown)" string when the bytesize
     has a negative value.
-    """
-    si_units = (
-            ('kB', 10**3),
-            ('MB', 10**6),
-            ('GB', 10**9),
-    )
-
-    binary_units = (
-            ('KiB', 2**10),
-            ('MiB', 2**20),
-            ('GiB', 2**30),
-    )
 
+    >>> format_filesize(1023)
+    '1023.00\\xa0B'
+    >>> format_filesize(1024)
+    '1.00\\xa0KiB'
+    >>> format_filesize(1000, use_si_units=True)
+    '1.00\\xa0kB'
+    >>> format_filesize(5 * 2**40, digits=0)
+    '5120\\xa0GiB'
+    """
     try:
         bytesize = float(bytesize)
     except:
@@ -598,9 +641,9 @@ def format_filesize(bytesize, use_si_units=False, digits=2):
         return _('(unknown)')
 
     if use_si_units:
-        units = si_units
+        units = _SI_UNITS
     else:
-        units = binary_units
+        units = _BINARY_UNITS
 
     (used_unit, used_value) = ('B', bytesize)
 
@@ -637,40 +680,85 @@ def is_html(text):
     return bool(html_test.search(text))
 
 
+_RE_STRIP_TAGS = re.compile(r'<[^>]*>')
+_RE_NEWLINE_TAGS = re.compile(r'(<br[^>]*>|<[/]?ul[^>]*>|</li>)', re.I)
+_RE_LISTING_TAGS = re.compile(r'<li[^>]*>', re.I)
+_RE_PARAGRAPH_TAGS = re.compile(r'<[Pp]>')
+_RE_EXCESSIVE_NEWLINES = re.compile(r'([\r\n]{2})([\r\n])+')
+# Numeric references are capped at 8 digits, which covers all code points
+# and keeps overlong references from reaching int() (they stay literal)
+_RE_HTML_ENTITIES = re.compile(r'&(?:#[xX]([0-9a-fA-F]{1,8})|#(\d{1,8})|([A-Za-z][A-Za-z0-9]*));')
+# Named entity -> replacement text, including HTML5 names such as "apos"
+_HTML_ENTITY_CHARS = dict((k[:-1], v) for k, v in html5.items() if k.endswith(';'))
+# Entities common in feeds that can be replaced without the regex; "&amp;"
+# is not among them, as replacing it first could create new entities
+_COMMON_HTML_ENTITIES = tuple(('&%s;' % name, _HTML_ENTITY_CHARS[name])
+                              for name in ('lt', 'gt', 'quot', 'apos', 'nbsp'))
+
+
+def _html_entity_to_char(match):
+    """
+    >>> _RE_HTML_ENTITIES.sub(_html_entity_to_char, '&#0;&#xD800;&#55296;&#x110000;&#65;')
+    '\ufffd\ufffd\ufffd\ufffdA'
+    >>> _RE_HTML_ENTITIES.sub(_html_entity_to_char, '&#' + '1' * 5000 + ';') == '&#' + '1' * 5000 + ';'
+    True
+    """
+    hexadecimal, decimal, name = match.groups()
+    if hexadecimal is None and decimal is None:
+        return _HTML_ENTITY_CHARS.get(name, match.group(0))
+
+    codepoint = int(hexadecimal, 16) if hexadecimal is not None else int(decimal)
+
+    # NUL, surrogates and out-of-range values are not valid characters
+    # (same as html.unescape), and lone surrogates break sqlite and GTK
+    if codepoint == 0 or 0xD800 <= codepoint <= 0xDFFF or codepoint > 0x10FFFF:
+        return '\ufffd'
+
+    return chr(codepoint)
+
+
 def remove_html_tags(html):
     """
     Remove HTML tags from a string and replace numeric and
     named entities with the corresponding character, so the
     HTML text can be displayed in a simple text view.
+
+    >>> remove_html_tags('<b>Fish &amp; Chips</b> &#8364;5 &#x263A; &bogus;')
+    'Fish & Chips €5 ☺ &bogus;'
+    >>> remove_html_tags('It&apos;s &ldquo;live&rdquo;&hellip;')
+    "It's “live”…"
+    >>> remove_html_tags('&lt;b&gt; is bold, &amp;lt; is &quot;&lt;&quot;')
+    '<b> is bold, &lt; is "<"'
+    >>> remove_html_tags('  Just plain text\\n\\n\\n\\nwith a gap ')
+    'Just plain text\\n\\nwith a gap'
     """
     if html is None:
         return None
 
-    # If we would want more speed, we could make these global
-    re_strip_tags = re.compile(r'<[^>]*>')
-    re_unicode_entities = re.compile(r'&#(\d{2,4});')
-    re_html_entities = re.compile(r'&(.{2,8});')
-    re_newline_tags = re.compile(r'(<br[^>]*>|<[/]?ul[^>]*>|</li>)', re.I)
-    re_listing_tags = re.compile(r'<li[^>]*>', re.I)
-
     result = html
 
-    # Convert common HTML elements to their text equivalent
-    result = re_newline_tags.sub('\n', result)
-    result = re_listing_tags.sub('\n * ', result)
-    result = re.sub(r'<[Pp]>', '\n\n', result)
+    # Plain text descriptions are common, so only run the
+    # substitutions if there can be something to replace
+    if '<' in result:
+        # Convert common HTML elements to their text equivalent
+        result = _RE_NEWLINE_TAGS.sub('\n', result)
+        result = _RE_LISTING_TAGS.sub('\n * ', result)
+        result = _RE_PARAGRAPH_TAGS.sub('\n\n', result)
 
-    # Remove all HTML/XML tags from the string
-    result = re_strip_tags.sub('', result)
+        # Remove all HTML/XML tags from the string
+        result = _RE_STRIP_TAGS.sub('', result)
 
-    # Convert numeric XML entities to their unicode character
-    result = re_unicode_entities.sub(lambda x: chr(int(x.group(1))), result)
+    if '&' in result:
+        for entity, char in _COMMON_HTML_ENTITIES:
+            if entity in result:
+                result = result.replace(entity, char)
 
-    # Convert named HTML entities to their unicode character
-    result = re_html_entities.sub(lambda x: entitydefs.get(x.group(1), ''), result)
+    if '&' in result:
+        # Convert numeric and named entities to their unicode character
+        result = _RE_HTML_ENTITIES.sub(_html_entity_to_char, result)
 
     # Convert more than two newlines to two newlines
-    result = re.sub(r'([\r\n]{2})([\r\n])+', '\\1', result)
+    result = _RE_EXCESSIVE_NEWLINES.sub('\\1', result)
 
     return result.strip()
 
@@ -978,6 +1066,7 @@ def extension_correct_for_mimetype(extension, mimetype):
     return extension in default + mimetypes.guess_all_extensions(mimetype)
 
 
+@functools.lru_cache(maxsize=4096)
 def filename_from_url(url):
     """
     Extracts the filename and (lowercase) extension (with dot)
@@ -1016,6 +1105,7 @@ def filename_from_url(url):
     return (filename, extension.lower())
 
 
+@functools.lru_cache(maxsize=256)
 def file_type_by_extension(extension):
     """
     Tries to guess the file type by looking up the filename
@@ -1045,8 +1135,8 @@ def file_type_by_extension(extension):
 
     extension = extension.lower()
 
-    if extension in _MIME_TYPES_EXT:
-        return _MIME_TYPES_EXT[extension].split('/')[0]
+    if extension in _FILE_TYPES_EXT:
+        return _FILE_TYPES_EXT[extension]
 
     # Need to prepend something to the extension, so guess_type works
     type, encoding = mimetypes.guess_type('file' + extension)
@@ -1069,6 +1159,17 @@ def get_first_line(s):
     return ''
 
 
+_FORMATTER_PATTERN_CACHE = {}
+
+
+def _formatter_pattern(keys):
+    pattern = _FORMATTER_PATTERN_CACHE.get(keys)
+    if pattern is None:
+        pattern = re.compile(r'\{(%s)\.([^\}]+)\}' % '|'.join(map(re.escape, keys)))
+        _FORMATTER_PATTERN_CACHE[keys] = pattern
+    return pattern
+
+
 def object_string_formatter(s, **kwargs):
     """
     Makes attributes of object passed in as keyword
@@ -1088,20 +1189,31 @@ def object_string_formatter(s, **kwargs):
     >>> a.published = 123
     >>> object_string_formatter('Hi {episode.published} 456', episode=a)
     'Hi 123 456'
-    """
-    result = s
-    for key, o in kwargs.items():
-        matches = re.findall(r'\{%s\.([^\}]+)\}' % key, s)
-        for attr in matches:
-            if hasattr(o, attr):
-                try:
-                    from_s = '{%s.%s}' % (key, attr)
-                    to_s = str(getattr(o, attr))
-                    result = result.replace(from_s, to_s)
-                except:
-                    logger.warn('Replace of "%s" failed for "%s".', attr, s)
-
-    return result
+
+    Substituted values are not expanded again:
+
+    >>> class x: pass
+    >>> a, b = x(), x()
+    >>> a.title = '{podcast.url}'
+    >>> b.url = 'http://example.com/feed.xml'
+    >>> object_string_formatter('{episode.title} {podcast.url}', episode=a, podcast=b)
+    '{podcast.url} http://example.com/feed.xml'
+    """
+    if not kwargs:
+        return s
+
+    def replacement(match):
+        key, attr = match.groups()
+        o = kwargs[key]
+        if hasattr(o, attr):
+            try:
+                return str(getattr(o, attr))
+            except:
+                logger.warn('Replace of "%s" failed for "%s".', attr, s)
+        return match.group(0)
+
+    # A single pass over the template, so replacement text is never rescanned
+    return _formatter_pattern(tuple(sorted(kwargs))).sub(replacement, s)
 
 
 def format_desktop_command(command, filenames, start_position=None):